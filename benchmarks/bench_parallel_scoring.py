@@ -0,0 +1,129 @@
+"""Benchmark in-process vs process-pool candidate scoring.
+
+Measures, on this machine:
+
+* ``s`` - in-process scoring cost per candidate
+* ``m`` - parent-side cost per candidate on the pool path (shard split,
+  pickling the shards, merging shard results)
+* ``f`` - fixed cost of one pool round trip
+
+and the actual pool time when several CPUs are available. Workers pay
+roughly ``m`` again to unpickle their shard, so with ``W`` workers the
+pool takes about ``f + N * m + N * (s + m) / W`` against ``N * s``
+in-process, and wins above
+
+    N* = f / (s * (1 - 1 / W) - m * (1 + 1 / W))
+
+candidates. Workers map one shared snapshot of the records, so none of
+this grows with the corpus beyond the shard itself. The script prints the
+crossover for common worker counts; ``KnowledgeSearch.parallel_threshold``
+is off by default and should only be set from a run on the target host.
+
+Usage: python benchmarks/bench_parallel_scoring.py [records ...]
+"""
+
+import os
+import pickle
+import random
+import statistics
+import sys
+import tempfile
+import time
+from itertools import repeat
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from knowledge_vault import search as search_module  # noqa: E402
+from knowledge_vault.search import KnowledgeSearch  # noqa: E402
+from knowledge_vault.storage import KnowledgeStorage, tokenize  # noqa: E402
+
+WORDS = (
+    "python java rust 编程 算法 数据 notes project meeting deadline list code "
+    "closure decorator generator iterator async await thread process"
+).split()
+QUERY = "python"
+
+
+def timed(fn, repeats=5):
+    """Median wall time of fn() in seconds."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def build(records):
+    """Fresh storage in a temp home with records mentioning QUERY."""
+    os.environ["HOME"] = tempfile.mkdtemp()
+    storage = KnowledgeStorage()
+    rng = random.Random(records)
+    for _ in range(records):
+        words = rng.choices(WORDS, k=rng.randint(20, 120)) + [QUERY]
+        storage.store(" ".join(words), tags=rng.choice(WORDS), auto_tag=False)
+    return storage
+
+
+def measure(records, k=30):
+    storage = build(records)
+    engine = KnowledgeSearch(storage)
+    candidates = storage.find_candidates(tokenize(QUERY))
+    n = len(candidates)
+
+    serial = timed(lambda: engine._top_scored(candidates, QUERY, k))
+
+    # Parent-side work of the pool path, without any worker involvement
+    def marshal():
+        remote = [(o, r["_pos"], h) for o, (r, h) in enumerate(candidates)]
+        size = -(-len(remote) // engine._pool_workers)
+        chunks = [remote[i : i + size] for i in range(0, len(remote), size)]
+        pickle.dumps(chunks)
+        search_module.heapq.nlargest(k, [(0.0, o) for o in range(k * len(chunks))])
+
+    parent = timed(marshal)
+
+    result = {"candidates": n, "serial": serial, "parent": parent}
+    # Build synchronously; with one CPU a single forced worker still
+    # measures the round trip
+    records = storage.get_all_records()
+    engine._build_pool(records, len(records))
+    if engine._pool_workers >= 2:
+        engine.parallel_threshold = 0
+        result["pool"] = timed(lambda: engine._top_scored(candidates, QUERY, k))
+    pool = engine._pool
+    list(pool.map(search_module._score_chunk, [[]], repeat(QUERY), repeat(k)))
+    result["fixed"] = timed(
+        lambda: list(pool.map(search_module._score_chunk, [[]], repeat(QUERY), repeat(k)))
+    )
+    engine.close()
+    return result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5000, 20000, 50000]
+    workers = os.cpu_count() or 1
+    print(f"cpus: {workers}")
+    print(f"{'N':>7} {'serial ms':>10} {'parent ms':>10} {'pool ms':>9} {'fixed ms':>9}")
+    per_candidate, per_parent, fixed = [], [], []
+    for size in sizes:
+        r = measure(size)
+        pool = f"{r['pool'] * 1e3:9.1f}" if "pool" in r else f"{'-':>9}"
+        print(
+            f"{r['candidates']:>7} {r['serial'] * 1e3:10.1f} "
+            f"{r['parent'] * 1e3:10.1f} {pool} {r['fixed'] * 1e3:9.1f}"
+        )
+        per_candidate.append(r["serial"] / r["candidates"])
+        per_parent.append(r["parent"] / r["candidates"])
+        fixed.append(r["fixed"])
+
+    s, m, f = statistics.median(per_candidate), statistics.median(per_parent), max(fixed)
+    print(f"\ns = {s * 1e6:.2f} us, m = {m * 1e6:.2f} us per candidate; f = {f * 1e3:.2f} ms")
+    for w in (2, 4, 8, 16):
+        gain = s * (1 - 1 / w) - m * (1 + 1 / w)
+        crossover = f"{f / gain:,.0f}" if gain > 0 else "never"
+        print(f"W={w:>2}: pool wins above {crossover} candidates")
+
+
+if __name__ == "__main__":
+    main()
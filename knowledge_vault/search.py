@@ -1,46 +1,245 @@
 """Knowledge search functionality with fuzzy matching."""
 
+import heapq
+import logging
+import mmap
+import multiprocessing
+import os
 import re
-from typing import Dict, List
+import tempfile
+import threading
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
 from difflib import SequenceMatcher
 
+try:
+    from rapidfuzz import fuzz
+except ImportError:
+    fuzz = None
+
+from .storage import tokenize
+
+logger = logging.getLogger("knowledge-vault")
+
+
+def similarity(a: str, b: str, cutoff: float = 0.0) -> float:
+    """Similarity ratio in [0, 1], using RapidFuzz when it is installed.
+
+    Ratios below cutoff are reported as 0 so the full computation can be
+    skipped when a cheap upper bound already rules the pair out.
+    """
+    if fuzz is not None:
+        return fuzz.ratio(a, b, score_cutoff=cutoff * 100) / 100.0
+
+    matcher = SequenceMatcher(None, a, b)
+    if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+        return 0.0
+    ratio = matcher.ratio()
+    return ratio if ratio >= cutoff else 0.0
+
+
+def _score_matches(
+    in_title: bool,
+    title_prefix: bool,
+    in_content: bool,
+    in_tags: bool,
+    hits: Tuple[float, float, float],
+) -> float:
+    """Relevance score from where the query occurs and token hit weights."""
+    score = 0.0
+
+    # Exact matches in title (highest weight)
+    if in_title:
+        score += 100
+
+    # Title starting with the query reads like an autocomplete hit
+    if title_prefix:
+        score += 20
+
+    # Exact matches in content
+    if in_content:
+        score += 50
+
+    # Exact matches in tags
+    if in_tags:
+        score += 75
+
+    # Boost for query token occurrences (BM25-weighted by storage)
+    title_hits, content_hits, tag_hits = hits
+    score += title_hits * 10
+    score += content_hits * 5
+    score += tag_hits * 15
+
+    return score
+
+
+def _score_fields(
+    title: str, content: str, tags: str, query: str, hits: Tuple[float, float, float]
+) -> float:
+    """Relevance score from lowercased record fields and token hit weights."""
+    return _score_matches(
+        query in title, title.startswith(query), query in content, query in tags, hits
+    )
+
+
+def _write_snapshot(records: List[Dict]) -> str:
+    """Write the records' lowercased fields to a temp file workers can map.
+
+    Layout: record count, then 3 * count + 1 int64 field end offsets, then
+    the UTF-8 title, content and tags of every record back to back.
+    """
+    fields = []
+    ends = array("q", [0])
+    for record in records:
+        for key in ("_title_lc", "_content_lc", "_tags_lc"):
+            data = record[key].encode("utf-8")
+            fields.append(data)
+            ends.append(ends[-1] + len(data))
+
+    fd, path = tempfile.mkstemp(prefix="knowledge-vault-", suffix=".snapshot")
+    with os.fdopen(fd, "wb") as f:
+        f.write(array("q", [len(records)]).tobytes())
+        f.write(ends.tobytes())
+        f.writelines(fields)
+    return path
+
+
+def _retire_pool(pool: ProcessPoolExecutor, path: str):
+    """Let a pool finish its queued shards, then drop its snapshot file."""
+    pool.shutdown(wait=True)
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+# Snapshot mapped by each worker: read-only pages shared between processes
+_snapshot: Optional[mmap.mmap] = None
+_snapshot_ends: Optional[memoryview] = None
+_snapshot_base = 0
+
+
+def _init_worker(path: str):
+    """Process pool initializer: map the record snapshot for later queries."""
+    global _snapshot, _snapshot_ends, _snapshot_base
+    with open(path, "rb") as f:
+        _snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    count = memoryview(_snapshot)[:8].cast("q")[0]
+    _snapshot_base = 8 * (3 * count + 2)
+    _snapshot_ends = memoryview(_snapshot)[8:_snapshot_base].cast("q")
+
+
+def _score_chunk(chunk: List[Tuple], query: str, k: int) -> List[Tuple[float, int]]:
+    """Score (order, position, hits) triples in a worker and return its top k."""
+    # UTF-8 substring tests on bytes agree with str ones, so search the
+    # mapped fields in place instead of decoding them
+    needle = query.encode("utf-8")
+    size = len(needle)
+    snapshot, ends, base = _snapshot, _snapshot_ends, _snapshot_base
+
+    scored = []
+    for order, position, hits in chunk:
+        field = 3 * position
+        title, content, tags, end = (base + ends[field + i] for i in range(4))
+        score = _score_matches(
+            snapshot.find(needle, title, content) != -1,
+            content - title >= size and snapshot[title : title + size] == needle,
+            snapshot.find(needle, content, tags) != -1,
+            snapshot.find(needle, tags, end) != -1,
+            hits,
+        )
+        scored.append((score, order))
+    return heapq.nlargest(k, scored, key=_rank_key)
+
+
+def _rank_key(item: Tuple[float, int]) -> Tuple[float, int]:
+    """Highest score first, earlier candidates first on ties."""
+    return item[0], -item[1]
+
 
 class KnowledgeSearch:
     """Knowledge search engine with fuzzy text matching."""
 
+    # Candidate count from which scoring is sharded across a process pool.
+    # None keeps scoring in-process: the pool only pays off with several
+    # CPUs, so measure the crossover on the target host with
+    # benchmarks/bench_parallel_scoring.py before enabling it
+    parallel_threshold: Optional[int] = None
+
+    # More workers mostly add IPC and merge work in the parent
+    max_pool_workers = 4
+
     def __init__(self, storage):
         self.storage = storage
+        # Per-instance cache; stale entries age out once the version changes
+        self._search_cached = lru_cache(maxsize=256)(self._search_impl)
+
+        # Process pool for scoring large candidate sets, built in the background
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_workers = min(os.cpu_count() or 1, self.max_pool_workers)
+        # Cache list the pool's snapshot was written from, and how much of it
+        self._pool_records: Optional[List[Dict]] = None
+        self._pool_seeded = 0
+        # Shuts the live pool down and removes its snapshot, at most once
+        self._pool_retire: Optional[weakref.finalize] = None
+        self._pool_builder: Optional[threading.Thread] = None
+        self._pool_lock = threading.Lock()
 
     def search(self, query: str, limit: int = 10, tag_filter: str = "") -> Dict:
         """Search knowledge records with fuzzy matching."""
-        all_records = self.storage.get_all_records()
+        total, results = self._search_cached(
+            query, limit, tag_filter, self.storage.cache_version()
+        )
+        # Copies, tags included, keep callers from mutating the cached entries
+        return {
+            "query": query,
+            "total": total,
+            "results": [
+                {**result, "tags": list(result["tags"])} for result in results
+            ],
+        }
+
+    def _search_impl(
+        self, query: str, limit: int, tag_filter: str, version: Tuple
+    ) -> Tuple[int, Tuple[Dict, ...]]:
+        """Run a search; version is only part of the cache key."""
+        query_lower = query.lower()
 
         # Filter by tags if specified
+        filter_tags = None
         if tag_filter:
-            filter_tags = [tag.strip().lower() for tag in tag_filter.split(",")]
-            filtered_records = []
-            for record in all_records:
-                record_tags = [tag.lower() for tag in record.get("tags", [])]
-                if any(ftag in record_tags for ftag in filter_tags):
-                    filtered_records.append(record)
-            all_records = filtered_records
-
-        # Score and rank records
-        scored_results = []
-        query_lower = query.lower()
+            filter_tags = {
+                tag.strip().lower() for tag in tag_filter.split(",") if tag.strip()
+            }
 
-        for record in all_records:
-            score = self._calculate_score(record, query_lower)
-            if score > 0:
-                scored_results.append((score, record))
+        # Records sharing a token with the query, or whose title/tag starts
+        # with it (partial words while typing); if there are none, records
+        # containing the query as a substring
+        candidates = self.storage.find_candidates(
+            tokenize(query_lower),
+            prefix=query_lower.strip(),
+            substring=query_lower,
+            tags=filter_tags,
+        )
 
-        # Sort by score (descending)
-        scored_results.sort(key=lambda x: x[0], reverse=True)
+        # Score and rank records; fuzzy similarity is expensive, so only the
+        # leading candidates are refined with it
+        ranked = []
+        for score, record in self._top_scored(candidates, query_lower, limit * 3):
+            score += self._similarity_score(record, query_lower)
+            ranked.append((score, record))
 
-        # Format results
+        # Format results (top scores first)
         results = []
-        for score, record in scored_results[:limit]:
-            snippet = self._generate_snippet(record["content"], query_lower)
+        pattern = self._query_pattern(query_lower)
+        for score, record in heapq.nlargest(limit, ranked, key=lambda x: x[0]):
+            snippet = self._generate_snippet(
+                record["content"], record["_content_lc"], query_lower, pattern
+            )
             results.append(
                 {
                     "id": record["id"],
@@ -52,68 +251,158 @@ class KnowledgeSearch:
                 }
             )
 
-        return {"query": query, "total": len(scored_results), "results": results}
+        return len(candidates), tuple(results)
+
+    def _calculate_score(
+        self, record: Dict, query: str, hits: Tuple[float, float, float]
+    ) -> float:
+        """Calculate relevance score for a record from its token hits."""
+        return _score_fields(
+            record["_title_lc"], record["_content_lc"], record["_tags_lc"], query, hits
+        )
+
+    def _top_scored(
+        self, candidates: List[Tuple[Dict, Tuple]], query: str, k: int
+    ) -> List[Tuple[float, Dict]]:
+        """Score candidates and return the k best, ordered like a stable sort."""
+        threshold = self.parallel_threshold
+        # One CPU gains nothing from the pool, only IPC overhead
+        if threshold is None or len(candidates) < threshold or self._pool_workers < 2:
+            scored = [
+                (self._calculate_score(record, query, hits), record)
+                for record, hits in candidates
+            ]
+            return heapq.nlargest(k, scored, key=lambda x: x[0])
+        return self._top_scored_parallel(candidates, query, k)
 
-    def _calculate_score(self, record: Dict, query: str) -> float:
-        """Calculate relevance score for a record."""
-        title = record.get("title", "").lower()
-        content = record.get("content", "").lower()
-        tags = " ".join(record.get("tags", [])).lower()
+    def _top_scored_parallel(
+        self, candidates: List[Tuple[Dict, Tuple]], query: str, k: int
+    ) -> List[Tuple[float, Dict]]:
+        """Shard scoring across the process pool, merging each shard's top k."""
+        records = self.storage.get_all_records()
+        # The lock covers submission: the builder swaps pools under it, and
+        # retiring a pool waits for the shards already submitted to it
+        with self._pool_lock:
+            unseeded = len(records) - self._pool_seeded
+            stale = self._pool_records is not records
+            if (stale or unseeded > self.parallel_threshold) and not self._pool_builder:
+                # Searches keep using the current pool, if any, meanwhile
+                # The cache list may grow meanwhile; snapshot its current length
+                self._pool_builder = threading.Thread(
+                    target=self._build_pool, args=(records, len(records)), daemon=True
+                )
+                self._pool_builder.start()
+            pool, snapshot, seeded = self._pool, self._pool_records, self._pool_seeded
 
-        score = 0.0
+            # Workers only know records from their snapshot; score the rest here
+            remote, scored = [], []
+            for order, (record, hits) in enumerate(candidates):
+                position = record["_pos"]
+                if position < seeded and snapshot[position] is record:
+                    remote.append((order, position, hits))
+                else:
+                    scored.append((self._calculate_score(record, query, hits), order))
 
-        # Exact matches in title (highest weight)
-        if query in title:
-            score += 100
+            shards = []
+            if remote:
+                size = -(-len(remote) // self._pool_workers)
+                chunks = [remote[i : i + size] for i in range(0, len(remote), size)]
+                # Executor.map submits every chunk before returning
+                shards = pool.map(_score_chunk, chunks, repeat(query), repeat(k))
 
-        # Exact matches in content
-        if query in content:
-            score += 50
+        for top in shards:
+            scored.extend(top)
 
-        # Exact matches in tags
-        if query in tags:
-            score += 75
+        return [
+            (score, candidates[order][0])
+            for score, order in heapq.nlargest(k, scored, key=_rank_key)
+        ]
 
-        # Fuzzy matching for partial matches
-        title_similarity = SequenceMatcher(None, query, title).ratio()
-        content_similarity = SequenceMatcher(None, query, content).ratio()
+    def _build_pool(self, records: List[Dict], count: int):
+        """Start a pool on a snapshot of the first count records and swap it in."""
+        path = retire = None
+        try:
+            path = _write_snapshot(records[:count])
+            # spawn: forking a threaded server process is not safe
+            pool = ProcessPoolExecutor(
+                max_workers=self._pool_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(path,),
+            )
+            retire = weakref.finalize(self, _retire_pool, pool, path)
+            # Spawn the workers here rather than on the next query's shards
+            empty = [[]] * self._pool_workers
+            list(pool.map(_score_chunk, empty, repeat(""), repeat(0)))
+        except Exception:
+            logger.exception("Could not start the scoring pool, scoring in-process")
+            if retire is not None:
+                retire()
+            elif path is not None:
+                os.unlink(path)
+            with self._pool_lock:
+                self._pool_builder = None
+            return
 
-        score += title_similarity * 30
-        score += content_similarity * 20
+        with self._pool_lock:
+            previous = self._pool_retire
+            self._pool, self._pool_retire = pool, retire
+            self._pool_records, self._pool_seeded = records, count
+            self._pool_builder = None
+        # Waits for shards still running on the old pool, outside the lock
+        if previous is not None:
+            previous()
 
-        # Boost for query word matches
-        query_words = query.split()
-        for word in query_words:
-            if len(word) > 2:  # Skip very short words
-                if word in title:
-                    score += 10
-                if word in content:
-                    score += 5
-                if word in tags:
-                    score += 15
+    def close(self):
+        """Stop the scoring pool and remove its snapshot file."""
+        with self._pool_lock:
+            builder = self._pool_builder
+        if builder is not None:
+            builder.join()
+        with self._pool_lock:
+            retire, self._pool_retire = self._pool_retire, None
+            self._pool, self._pool_records, self._pool_seeded = None, None, 0
+        if retire is not None:
+            retire()
 
-        return score
+    def _similarity_score(self, record: Dict, query: str) -> float:
+        """Calculate fuzzy similarity bonus for a record."""
+        title = record["_title_lc"]
+        content = record["_content_lc"]
 
-    def _generate_snippet(self, content: str, query: str, max_length: int = 150) -> str:
-        """Generate a snippet highlighting the query context."""
-        content_lower = content.lower()
+        # Fuzzy matching for partial matches; near-zero ratios barely move
+        # the ranking, so skip computing them exactly
+        title_similarity = similarity(query, title, cutoff=0.1)
+        content_similarity = similarity(query, content, cutoff=0.1)
 
-        # Find the first occurrence of the query or query words
-        best_pos = -1
-        query_words = query.split()
+        return title_similarity * 30 + content_similarity * 20
 
+    def _query_pattern(self, query: str) -> Optional[re.Pattern]:
+        """Compile the query's longer words into one alternation, if any."""
+        # The whole query is looked up first, so it is not an alternative;
+        # repeats are dropped so each word is tried once per position
+        words = dict.fromkeys(
+            word for word in query.split() if len(word) > 2 and word != query
+        )
+        if not words:
+            return None
+        return re.compile("|".join(re.escape(w) for w in words))
+
+    def _generate_snippet(
+        self,
+        content: str,
+        content_lower: str,
+        query: str,
+        pattern: Optional[re.Pattern],
+        max_length: int = 150,
+    ) -> str:
+        """Generate a snippet highlighting the query context."""
         # Try exact query match first
-        pos = content_lower.find(query)
-        if pos != -1:
-            best_pos = pos
-        else:
-            # Try individual words
-            for word in query_words:
-                if len(word) > 2:
-                    pos = content_lower.find(word)
-                    if pos != -1:
-                        best_pos = pos
-                        break
+        best_pos = content_lower.find(query)
+        if best_pos == -1 and pattern is not None:
+            # Then the first of any query word, in one scan
+            match = pattern.search(content_lower)
+            best_pos = match.start() if match else -1
 
         if best_pos == -1:
             # No match found, return beginning
@@ -134,14 +423,16 @@ class KnowledgeSearch:
 
     def search_recent(self, limit: int = 20) -> List[Dict]:
         """Get recent knowledge records."""
-        records = self.storage.get_all_records()
-
-        # Sort by timestamp (newest first)
-        records.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+        # Newest first; nlargest leaves the shared cache untouched
+        records = heapq.nlargest(
+            limit,
+            self.storage.get_all_records(),
+            key=lambda x: x.get("timestamp", ""),
+        )
 
         # Format results
         results = []
-        for record in records[:limit]:
+        for record in records:
             snippet = record["content"][:150]
             if len(record["content"]) > 150:
                 snippet += "..."
@@ -151,7 +442,7 @@ class KnowledgeSearch:
                     "id": record["id"],
                     "title": record["title"],
                     "snippet": snippet,
-                    "tags": record.get("tags", []),
+                    "tags": list(record.get("tags", [])),
                     "timestamp": record["timestamp"],
                 }
             )
@@ -52,6 +52,18 @@ class SearchByTagsRequest(BaseModel):
     limit: int = Field(20, description="返回结果数量限制", ge=1, le=100)
 
 
+def _format_entry(index: int, result: dict, snippet: str) -> str:
+    """Format one record entry of a list-style tool response."""
+    tags = ", ".join(result["tags"]) if result["tags"] else "无标签"
+    return (
+        f"【{index}】{result['title']}\n"
+        f"🆔 {result['id']}\n"
+        f"📝 {snippet}\n"
+        f"🏷️ {tags}\n"
+        f"⏰ {result['timestamp'][:19]}\n\n"
+    )
+
+
 @mcp.tool()
 def store_knowledge(request: StoreKnowledgeRequest) -> str:
     """存储一条知识记录到本地"""
@@ -82,15 +94,11 @@ def search_knowledge(request: SearchKnowledgeRequest) -> str:
         if not results["results"]:
             return f"🔍 未找到与 '{request.query}' 相关的知识记录"
 
-        response_text = f"🔍 搜索结果 (共找到 {results['total']} 条记录)\n\n"
+        parts = [f"🔍 搜索结果 (共找到 {results['total']} 条记录)\n\n"]
         for i, result in enumerate(results["results"], 1):
-            response_text += f"【{i}】{result['title']}\n"
-            response_text += f"🆔 {result['id']}\n"
-            response_text += f"📝 {result['snippet']}\n"
-            response_text += f"🏷️ {', '.join(result['tags']) if result['tags'] else '无标签'}\n"
-            response_text += f"⏰ {result['timestamp'][:19]}\n\n"
+            parts.append(_format_entry(i, result, result["snippet"]))
 
-        return response_text
+        return "".join(parts)
     except Exception as e:
         logger.error(f"Error searching knowledge: {e}")
         return f"❌ 搜索失败: {str(e)}"
@@ -105,15 +113,11 @@ def list_recent(request: ListRecentRequest) -> str:
         if not results:
             return "📋 暂无知识记录"
 
-        response_text = f"📋 最近的 {len(results)} 条记录\n\n"
+        parts = [f"📋 最近的 {len(results)} 条记录\n\n"]
         for i, result in enumerate(results, 1):
-            response_text += f"【{i}】{result['title']}\n"
-            response_text += f"🆔 {result['id']}\n"
-            response_text += f"📝 {result['snippet']}\n"
-            response_text += f"🏷️ {', '.join(result['tags']) if result['tags'] else '无标签'}\n"
-            response_text += f"⏰ {result['timestamp'][:19]}\n\n"
+            parts.append(_format_entry(i, result, result["snippet"]))
 
-        return response_text
+        return "".join(parts)
     except Exception as e:
         logger.error(f"Error listing recent records: {e}")
         return f"❌ 获取记录失败: {str(e)}"
@@ -127,14 +131,17 @@ def get_knowledge(request: GetKnowledgeRequest) -> str:
         if not record:
             return f"❌ 未找到ID为 '{request.id}' 的知识记录"
 
-        response_text = f"📖 知识记录详情\n\n"
-        response_text += f"📝 标题: {record['title']}\n"
-        response_text += f"🆔 ID: {record['id']}\n"
-        response_text += f"🏷️ 标签: {', '.join(record['tags']) if record['tags'] else '无'}\n"
-        response_text += f"⏰ 时间: {record['timestamp'][:19]}\n\n"
-        response_text += f"📄 内容:\n{record['content']}"
-
-        return response_text
+        tags = ", ".join(record["tags"]) if record["tags"] else "无"
+        parts = [
+            "📖 知识记录详情\n\n",
+            f"📝 标题: {record['title']}\n",
+            f"🆔 ID: {record['id']}\n",
+            f"🏷️ 标签: {tags}\n",
+            f"⏰ 时间: {record['timestamp'][:19]}\n\n",
+            f"📄 内容:\n{record['content']}",
+        ]
+
+        return "".join(parts)
     except Exception as e:
         logger.error(f"Error getting knowledge by ID: {e}")
         return f"❌ 获取记录失败: {str(e)}"
@@ -165,19 +172,15 @@ def search_by_tags(request: SearchByTagsRequest) -> str:
         if not results:
             return f"🏷️ 未找到包含标签 '{request.tags}' 的知识记录"
 
-        response_text = f"🏷️ 标签搜索结果 (共找到 {len(results)} 条记录)\n\n"
+        parts = [f"🏷️ 标签搜索结果 (共找到 {len(results)} 条记录)\n\n"]
         for i, result in enumerate(results, 1):
             snippet = result["content"][:150]
             if len(result["content"]) > 150:
                 snippet += "..."
 
-            response_text += f"【{i}】{result['title']}\n"
-            response_text += f"🆔 {result['id']}\n"
-            response_text += f"📝 {snippet}\n"
-            response_text += f"🏷️ {', '.join(result['tags']) if result['tags'] else '无标签'}\n"
-            response_text += f"⏰ {result['timestamp'][:19]}\n\n"
+            parts.append(_format_entry(i, result, snippet))
 
-        return response_text
+        return "".join(parts)
     except Exception as e:
         logger.error(f"Error searching by tags: {e}")
         return f"❌ 标签搜索失败: {str(e)}"
@@ -189,17 +192,19 @@ def get_stats() -> str:
     try:
         stats = storage.get_stats()
 
-        response_text = "📊 知识库统计信息\n\n"
-        response_text += f"📝 总记录数: {stats['total_records']}\n"
-        response_text += f"🏷️ 标签总数: {stats['total_tags']}\n"
-        response_text += f"💾 数据位置: {stats['data_location']}\n\n"
+        parts = [
+            "📊 知识库统计信息\n\n",
+            f"📝 总记录数: {stats['total_records']}\n",
+            f"🏷️ 标签总数: {stats['total_tags']}\n",
+            f"💾 数据位置: {stats['data_location']}\n\n",
+        ]
 
         if stats['top_tags']:
-            response_text += "🔥 热门标签:\n"
+            parts.append("🔥 热门标签:\n")
             for tag, count in stats['top_tags'].items():
-                response_text += f"  • {tag}: {count} 条记录\n"
+                parts.append(f"  • {tag}: {count} 条记录\n")
 
-        return response_text
+        return "".join(parts)
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         return f"❌ 获取统计信息失败: {str(e)}"
@@ -1,14 +1,132 @@
 """Knowledge storage module using user home directory for data persistence."""
 
+import heapq
 import json
+import math
+import mmap
+import re
 import uuid
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
+from collections import Counter
 from contextlib import contextmanager
 import fcntl
 import os
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Latin words index as whole tokens, CJK ideographs one character at a time
+_TOKEN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]|[^\W\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercased index tokens."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _loads(line):
+    """Parse one JSON line (str or bytes), using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(line)  # orjson.JSONDecodeError subclasses json's
+    return json.loads(line)
+
+
+def _dump_line(record: Dict) -> bytes:
+    """Serialize a record to one UTF-8 JSON line, trailing newline included."""
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+_BM25_K1 = 1.2
+
+
+def _bm25_idf(total_records: int, matching_records: int) -> float:
+    """BM25 inverse document frequency, normalized so a unique token scores 1.0."""
+    rare = math.log(1 + (total_records - 0.5) / 1.5)
+    if rare <= 0:
+        return 1.0
+    others = total_records - matching_records
+    return math.log(1 + (others + 0.5) / (matching_records + 0.5)) / rare
+
+
+def _bm25_tf(count: int) -> float:
+    """BM25 term-frequency saturation: 1.0 for one hit, approaching k1 + 1."""
+    return count * (_BM25_K1 + 1) / (count + _BM25_K1)
+
+
+@contextmanager
+def _mapped(f):
+    """Read-only mmap of an open binary file; an empty file maps to b""."""
+    if os.fstat(f.fileno()).st_size == 0:
+        yield b""  # mmap refuses zero-length files
+        return
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mm
+    finally:
+        mm.close()
+
+
+def _public_record(record: Dict) -> Dict:
+    """Copy of a cached record without the internal underscore keys."""
+    public = {key: value for key, value in record.items() if not key.startswith("_")}
+    # The tags list is the cached one; hand out a copy of it too
+    public["tags"] = list(public.get("tags", []))
+    return public
+
+
+# Simple keyword-based tagging
+TAG_KEYWORDS = {
+    "技术": ["技术", "编程", "代码", "api", "算法", "数据", "开发"],
+    "工作": ["工作", "项目", "会议", "任务", "计划", "deadline"],
+    "学习": ["学习", "教程", "笔记", "知识", "文档", "课程"],
+    "想法": ["想法", "思考", "观点", "感悟", "心得", "反思"],
+    "生活": ["生活", "日常", "个人", "健康", "休闲", "娱乐"],
+}
+_KEYWORD_TAGS = {kw: tag for tag, keywords in TAG_KEYWORDS.items() for kw in keywords}
+# Lookahead alternation: a single scan that still sees overlapping keywords
+_TAG_KEYWORD_RE = re.compile(
+    "(?=("
+    + "|".join(re.escape(kw) for kw in sorted(_KEYWORD_TAGS, key=len, reverse=True))
+    + "))"
+)
+
+
+class PrefixTrie:
+    """Character trie mapping string prefixes to record positions.
+
+    Every node keeps the positions of all keys passing through it, so a
+    prefix lookup costs O(len(prefix)) regardless of corpus size. Keys are
+    indexed up to ``max_depth`` characters; longer probes return a superset
+    that callers narrow down with ``startswith``.
+    """
+
+    def __init__(self, max_depth: int = 32):
+        self.max_depth = max_depth
+        self._root: Dict = {}
+
+    def insert(self, key: str, position: int):
+        """Index every prefix of key for position."""
+        node = self._root
+        for char in key[: self.max_depth]:
+            node = node.setdefault(char, {})
+            node.setdefault(None, set()).add(position)
+
+    def positions(self, prefix: str) -> Set[int]:
+        """Get positions of keys starting with prefix (superset past max_depth)."""
+        node = self._root
+        for char in prefix[: self.max_depth]:
+            node = node.get(char)
+            if node is None:
+                return set()
+        return node.get(None, set())
 
 
 class KnowledgeStorage:
@@ -20,18 +138,129 @@ class KnowledgeStorage:
         self.data_file = self.data_dir / "knowledge.jsonl"
         self.ensure_data_dir()
 
+        # In-memory view of the data file, reloaded only when it changes
+        self._cache_lock = threading.RLock()
+        self._reset_cache()
+
     def ensure_data_dir(self):
         """Ensure data directory exists."""
         self.data_dir.mkdir(parents=True, exist_ok=True)
         if not self.data_file.exists():
             self.data_file.touch()
 
+    def _reset_cache(self):
+        """Drop the in-memory record cache."""
+        # Fresh containers so lists already handed to callers stay intact
+        self._cache_records: List[Dict] = []
+        self._cache_by_id: Dict[str, Dict] = {}
+        self._cache_tag_index: Dict[str, List[int]] = {}
+        # token -> record position -> (title, content, tags) occurrence counts
+        self._token_index: Dict[str, Dict[int, Tuple[int, int, int]]] = {}
+        # Lowercased titles and tags, for prefix / autocomplete lookups
+        self._title_trie = PrefixTrie()
+        # Tag occurrence counts for get_stats
+        self._tag_counter: Counter = Counter()
+        self._cache_mtime: Optional[int] = None
+        self._cache_size: Optional[int] = None
+
+    def _index_record(self, record: Dict):
+        """Add a parsed record to the in-memory cache."""
+        # Lowercased variants used by scoring; never written to disk
+        record["_title_lc"] = record.get("title", "").lower()
+        record["_content_lc"] = record.get("content", "").lower()
+        record["_tags_lc"] = " ".join(record.get("tags", [])).lower()
+        record["_tags_set_lc"] = {tag.lower() for tag in record.get("tags", [])}
+
+        position = len(self._cache_records)
+        record["_pos"] = position
+        self._cache_records.append(record)
+        self._tag_counter.update(record.get("tags", []))
+        if "id" in record:
+            # First record wins on duplicate ids, as with the old linear scan
+            self._cache_by_id.setdefault(record["id"], record)
+        for tag in record["_tags_set_lc"]:
+            self._cache_tag_index.setdefault(tag, []).append(position)
+            self._title_trie.insert(tag, position)
+        self._title_trie.insert(record["_title_lc"], position)
+
+        fields = (record["_title_lc"], record["_content_lc"], record["_tags_lc"])
+        counts: Dict[str, List[int]] = {}
+        for field, text in enumerate(fields):
+            for token in tokenize(text):
+                counts.setdefault(token, [0, 0, 0])[field] += 1
+        for token, token_counts in counts.items():
+            self._token_index.setdefault(token, {})[position] = tuple(token_counts)
+
+    def _refresh_cache(self):
+        """Bring the cache up to date with the data file.
+
+        Appends made since the last load are parsed from the previous end
+        offset; any other change (shrink, rewrite, mtime going backwards)
+        triggers a full reload.
+        """
+        try:
+            stat = os.stat(self.data_file)
+        except FileNotFoundError:
+            self._reset_cache()
+            return
+
+        if (stat.st_mtime_ns, stat.st_size) == (self._cache_mtime, self._cache_size):
+            return
+
+        offset = 0
+        if (
+            self._cache_size is not None
+            and stat.st_size > self._cache_size
+            and stat.st_mtime_ns >= self._cache_mtime
+        ):
+            offset = self._cache_size
+
+        lines: List[bytes] = []
+        try:
+            # Shared lock held only while lines are copied out of the mapping;
+            # parsing happens after release
+            with self.file_lock("rb", fcntl.LOCK_SH) as f, _mapped(f) as mm:
+                # Stop at the stat snapshot; later writes show up next time
+                end = min(stat.st_size, len(mm))
+                # A clean append leaves our old end right after a newline
+                if offset and (offset > end or mm[offset - 1] != ord("\n")):
+                    offset = 0
+                pos = offset
+                while pos < end:
+                    newline = mm.find(b"\n", pos, end)
+                    if newline == -1:
+                        newline = end
+                    if newline > pos:
+                        lines.append(mm[pos:newline])
+                    pos = newline + 1
+        except FileNotFoundError:
+            self._reset_cache()
+            return
+
+        if not offset:
+            self._reset_cache()
+        for line in lines:
+            line = line.strip()
+            if line:
+                try:
+                    record = _loads(line)
+                    self._index_record(record)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue  # Skip corrupted lines
+
+        self._cache_mtime = stat.st_mtime_ns
+        self._cache_size = end
+
     @contextmanager
-    def file_lock(self, mode="r"):
-        """Thread-safe file operations with locking."""
-        with open(self.data_file, mode, encoding="utf-8") as f:
+    def file_lock(self, mode="r", lock_type=fcntl.LOCK_EX):
+        """Thread-safe file operations with locking.
+
+        Readers can pass ``fcntl.LOCK_SH`` so they only exclude writers.
+        """
+        encoding = None if "b" in mode else "utf-8"
+        with open(self.data_file, mode, encoding=encoding) as f:
             try:
-                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                fcntl.flock(f.fileno(), lock_type)
                 yield f
             finally:
                 fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -65,7 +294,7 @@ class KnowledgeStorage:
         if not success:
             raise Exception("Storage failed, please try again")
 
-        return {"id": record_id, "title": title, "tags": all_tags}
+        return {"id": record_id, "title": title, "tags": list(all_tags)}
 
     def _generate_title(self, content: str) -> str:
         """Auto-generate title from content."""
@@ -86,29 +315,21 @@ class KnowledgeStorage:
         """Auto-suggest tags based on content analysis."""
         text = f"{title} {content}".lower()
 
-        # Simple keyword-based tagging
-        tag_keywords = {
-            "技术": ["技术", "编程", "代码", "api", "算法", "数据", "开发"],
-            "工作": ["工作", "项目", "会议", "任务", "计划", "deadline"],
-            "学习": ["学习", "教程", "笔记", "知识", "文档", "课程"],
-            "想法": ["想法", "思考", "观点", "感悟", "心得", "反思"],
-            "生活": ["生活", "日常", "个人", "健康", "休闲", "娱乐"],
-        }
-
-        suggested = []
-        for tag, keywords in tag_keywords.items():
-            if any(keyword in text for keyword in keywords):
-                suggested.append(tag)
+        # One regex pass reports every keyword hit, overlapping ones included
+        hits = {_KEYWORD_TAGS[m.group(1)] for m in _TAG_KEYWORD_RE.finditer(text)}
+        suggested = [tag for tag in TAG_KEYWORDS if tag in hits]
 
         return suggested[:3]  # Limit to 3 suggestions
 
     def _safe_append_record(self, record: Dict) -> bool:
         """Thread-safe record appending with retry logic."""
+        line = _dump_line(record)
         max_retries = 3
         for i in range(max_retries):
             try:
-                with self.file_lock("a") as f:
-                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                # Same lock order as _refresh_cache: cache lock, then file lock
+                with self._cache_lock:
+                    self._append_line(record, line)
                 return True
             except Exception:
                 if i == max_retries - 1:
@@ -116,58 +337,141 @@ class KnowledgeStorage:
                 time.sleep(0.1 * (i + 1))  # Exponential backoff
         return False
 
-    def get_all_records(self) -> List[Dict]:
-        """Get all knowledge records."""
-        records = []
+    def _append_line(self, record: Dict, line: bytes):
+        """Append one serialized record with O_APPEND writes under flock."""
+        fd = os.open(self.data_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
         try:
-            with self.file_lock("r") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            record = json.loads(line)
-                            records.append(record)
-                        except json.JSONDecodeError:
-                            continue  # Skip corrupted lines
-        except FileNotFoundError:
-            pass
-        return records
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            before = os.fstat(fd)
+            view = memoryview(line)
+            while view:
+                view = view[os.write(fd, view) :]
+            after = os.fstat(fd)
+            self._cache_append(record, before, after)
+        finally:
+            os.close(fd)  # Closing the descriptor releases the flock
+
+    def _cache_append(
+        self, record: Dict, before: os.stat_result, after: os.stat_result
+    ):
+        """Add a freshly written record to the cache without re-reading the file."""
+        # Only valid if the cache matched the file right before our write
+        cached = (self._cache_mtime, self._cache_size)
+        if (before.st_mtime_ns, before.st_size) != cached:
+            return
+        self._index_record(record)
+        self._cache_mtime = after.st_mtime_ns
+        self._cache_size = after.st_size
+
+    def get_all_records(self) -> List[Dict]:
+        """Get all knowledge records.
+
+        The returned list is the shared cache and must not be modified.
+        """
+        with self._cache_lock:
+            self._refresh_cache()
+            return self._cache_records
+
+    def cache_version(self) -> Tuple:
+        """Token that changes whenever the cached records change."""
+        with self._cache_lock:
+            self._refresh_cache()
+            return (self._cache_mtime, self._cache_size)
 
     def get_by_id(self, record_id: str) -> Optional[Dict]:
         """Get record by ID."""
-        for record in self.get_all_records():
-            if record.get("id") == record_id:
-                return record
-        return None
+        with self._cache_lock:
+            self._refresh_cache()
+            record = self._cache_by_id.get(record_id)
+        return _public_record(record) if record else None
 
-    def search_by_tags(self, tags: List[str], limit: int = 20) -> List[Dict]:
-        """Search records by tags."""
-        records = self.get_all_records()
-        matching = []
+    def find_candidates(
+        self,
+        tokens: List[str],
+        prefix: str = "",
+        substring: Optional[str] = None,
+        tags: Optional[Set[str]] = None,
+    ) -> List[Tuple[Dict, Tuple[float, float, float]]]:
+        """Get records containing any token, or whose title/tag starts with prefix.
 
-        for record in records:
-            record_tags = record.get("tags", [])
-            if any(tag.lower() in [t.lower() for t in record_tags] for tag in tags):
-                matching.append(record)
+        Each record is paired with its (title, content, tags) hit weights:
+        per-field term counts summed over the query tokens, BM25-style, so
+        rare tokens outweigh common ones and repeats saturate.
 
-        # Sort by timestamp (newest first)
-        matching.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
-        return matching[:limit]
+        If tags is given, only records carrying one of those lowercased tags
+        are returned. When no record matches through the indexes, records
+        containing substring anywhere (e.g. "script" inside "javascript")
+        are found by a linear scan instead. The scan only runs on a miss, so
+        queries with any whole-token hit stay index-only; the cost is that a
+        partial word which is also a whole token elsewhere only finds the
+        whole-token records.
+        """
+        with self._cache_lock:
+            self._refresh_cache()
+            records = self._cache_records
+            allowed: Optional[Set[int]] = None
+            if tags is not None:
+                index = self._cache_tag_index
+                allowed = set().union(*[index[tag] for tag in tags if tag in index])
 
-    def get_stats(self) -> Dict:
-        """Get storage statistics."""
-        records = self.get_all_records()
-        all_tags = []
-        for record in records:
-            all_tags.extend(record.get("tags", []))
+            hits: Dict[int, List[float]] = {}
+            for token in set(tokens):
+                postings = self._token_index.get(token, {})
+                idf = _bm25_idf(len(records), len(postings))
+                for position, counts in postings.items():
+                    if allowed is not None and position not in allowed:
+                        continue
+                    total = hits.setdefault(position, [0.0, 0.0, 0.0])
+                    for field, count in enumerate(counts):
+                        if count:
+                            total[field] += idf * _bm25_tf(count)
 
-        from collections import Counter
+            if prefix:
+                for position in self._title_trie.positions(prefix):
+                    if position in hits:
+                        continue
+                    if allowed is not None and position not in allowed:
+                        continue
+                    record = records[position]
+                    keys = [record["_title_lc"], *record["_tags_set_lc"]]
+                    if any(key.startswith(prefix) for key in keys):
+                        hits[position] = [0.0, 0.0, 0.0]
 
-        tag_counts = Counter(all_tags)
+            if substring is not None and not hits:
+                positions = range(len(records)) if allowed is None else sorted(allowed)
+                for position in positions:
+                    record = records[position]
+                    if (
+                        substring in record["_content_lc"]
+                        or substring in record["_title_lc"]
+                        or substring in record["_tags_lc"]
+                    ):
+                        hits[position] = [0.0, 0.0, 0.0]
+            return [(records[p], tuple(h)) for p, h in hits.items()]
 
-        return {
-            "total_records": len(records),
-            "total_tags": len(set(all_tags)),
-            "top_tags": dict(tag_counts.most_common(10)),
-            "data_location": str(self.data_file),
-        }
+    def search_by_tags(self, tags: List[str], limit: int = 20) -> List[Dict]:
+        """Search records by tags."""
+        query = {tag.lower() for tag in tags}
+        with self._cache_lock:
+            self._refresh_cache()
+            records = self._cache_records
+            # Only records carrying one of the tags are ever touched
+            index = self._cache_tag_index
+            positions = set().union(*[index[tag] for tag in query if tag in index])
+
+        # Newest first
+        newest = heapq.nlargest(
+            limit, positions, key=lambda i: records[i].get("timestamp", "")
+        )
+        return [_public_record(records[i]) for i in newest]
+
+    def get_stats(self) -> Dict:
+        """Get storage statistics."""
+        with self._cache_lock:
+            self._refresh_cache()
+            return {
+                "total_records": len(self._cache_records),
+                "total_tags": len(self._tag_counter),
+                "top_tags": dict(self._tag_counter.most_common(10)),
+                "data_location": str(self.data_file),
+            }
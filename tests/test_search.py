@@ -0,0 +1,154 @@
+"""Regression tests for knowledge search recall."""
+
+import os
+import tempfile
+import unittest
+
+from knowledge_vault.search import KnowledgeSearch
+from knowledge_vault.storage import KnowledgeStorage, tokenize
+
+
+class SearchRecallTest(unittest.TestCase):
+    """Queries that only match part of a word must still find records."""
+
+    def setUp(self):
+        self._home = os.environ.get("HOME")
+        self._tmp = tempfile.TemporaryDirectory()
+        os.environ["HOME"] = self._tmp.name
+
+        self.storage = KnowledgeStorage()
+        self.search = KnowledgeSearch(self.storage)
+        self.storage.store("Notes on javascript closures", title="Closures")
+        self.storage.store("Python decorators wrap functions", title="Wrappers")
+        self.storage.store("Rust ownership rules", title="Ownership")
+        self.storage.store("Go channels and goroutines", title="Channels")
+
+    def tearDown(self):
+        if self._home is None:
+            os.environ.pop("HOME", None)
+        else:
+            os.environ["HOME"] = self._home
+        self._tmp.cleanup()
+
+    def titles(self, query, **kwargs):
+        return [r["title"] for r in self.search.search(query, **kwargs)["results"]]
+
+    def test_partial_word_in_content(self):
+        self.assertEqual(self.titles("script"), ["Closures"])
+        self.assertEqual(self.titles("decorat"), ["Wrappers"])
+
+    def test_partial_word_in_content_with_tag_filter(self):
+        self.storage.store("More javascript tips", title="Tips", tags="web")
+        self.assertEqual(self.titles("script", tag_filter="web"), ["Tips"])
+
+    def test_partial_word_behind_tag_filter_with_many_whole_token_hits(self):
+        for i in range(12):
+            self.storage.store(f"a shell script example {i}", title=f"Script {i}")
+        self.storage.store("javascript tips", title="JS", tags="web")
+
+        results = self.search.search("script", tag_filter="web")
+        self.assertEqual(results["total"], 1)
+        self.assertEqual([r["title"] for r in results["results"]], ["JS"])
+
+    def test_total_does_not_depend_on_limit(self):
+        for i in range(12):
+            self.storage.store(f"a shell script example {i}", title=f"Script {i}")
+        self.storage.store("javascript tips", title="JS")
+
+        totals = {self.search.search("script", limit=n)["total"] for n in (1, 10, 20)}
+        self.assertEqual(totals, {12})
+
+    def test_snippet_prefers_exact_phrase_over_earlier_word(self):
+        filler = "filler text " * 30
+        self.storage.store(
+            f"python is fun. {filler}python decorators wrap functions nicely",
+            title="Phrase",
+        )
+        result = self.search.search("python decorators", tag_filter="")["results"]
+        snippet = next(r["snippet"] for r in result if r["title"] == "Phrase")
+        self.assertIn("python decorators wrap", snippet)
+        self.assertTrue(snippet.startswith("..."))
+
+    def test_returned_tags_do_not_alias_the_cache(self):
+        stored = self.storage.store(
+            "zebra stripes", title="Zebra", tags="animal", auto_tag=False
+        )
+        record_id = stored["id"]
+        stored["tags"].append("mutated")
+        self.storage.get_by_id(record_id)["tags"].append("mutated")
+        self.search.search("zebra")["results"][0]["tags"].append("mutated")
+        self.search.search_recent(1)[0]["tags"].append("mutated")
+        self.assertEqual(self.storage.get_by_id(record_id)["tags"], ["animal"])
+        self.assertEqual(self.search.search("zebra")["results"][0]["tags"], ["animal"])
+
+    def test_empty_query_returns_every_record(self):
+        self.assertEqual(self.search.search("")["total"], 4)
+
+    def test_whole_token_match_still_ranked(self):
+        self.assertEqual(self.titles("ownership"), ["Ownership"])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class ParallelScoringTest(unittest.TestCase):
+    """Scoring on the process pool must rank exactly like in-process scoring."""
+
+    def setUp(self):
+        self._home = os.environ.get("HOME")
+        self._tmp = tempfile.TemporaryDirectory()
+        os.environ["HOME"] = self._tmp.name
+
+        self.storage = KnowledgeStorage()
+        for i in range(40):
+            # Non-ASCII fields shift byte offsets away from character offsets
+            self.storage.store(
+                f"笔记 {i} python " * (i % 3 + 1) + "多线程" * (i % 5),
+                title=f"Python 第{i}条" if i % 4 else f"编程 note {i}",
+                tags="python" if i % 2 else "算法",
+                auto_tag=False,
+            )
+        self.serial = KnowledgeSearch(self.storage)
+        self.parallel = KnowledgeSearch(self.storage)
+        self.parallel._pool_workers = 2
+        self.parallel.parallel_threshold = 1
+        self.addCleanup(self.parallel.close)
+
+    def tearDown(self):
+        if self._home is None:
+            os.environ.pop("HOME", None)
+        else:
+            os.environ["HOME"] = self._home
+        self._tmp.cleanup()
+
+    def ranked(self, engine, query):
+        candidates = self.storage.find_candidates(tokenize(query), prefix=query)
+        return [
+            (score, record["id"])
+            for score, record in engine._top_scored(candidates, query, 25)
+        ]
+
+    def wait_for_pool(self):
+        builder = self.parallel._pool_builder
+        if builder is not None:
+            builder.join()
+        self.assertIsNotNone(self.parallel._pool)
+
+    def test_pool_matches_in_process_ranking(self):
+        # The first query starts the pool and scores in-process meanwhile
+        for query in ("python", "笔记", "python 第", "编"):
+            self.assertEqual(
+                self.ranked(self.parallel, query), self.ranked(self.serial, query)
+            )
+        self.wait_for_pool()
+        for query in ("python", "笔记", "python 第", "编"):
+            self.assertEqual(
+                self.ranked(self.parallel, query), self.ranked(self.serial, query)
+            )
+
+        # Records added after the snapshot are scored in-process
+        self.storage.store("python 新笔记", title="Python late", auto_tag=False)
+        self.assertEqual(
+            self.ranked(self.parallel, "python"), self.ranked(self.serial, "python")
+        )